@@ -0,0 +1,20 @@
+import os
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping
+
+from dotenv import load_dotenv
+
+
+@lru_cache(maxsize=1)
+def get_env() -> Mapping[str, str]:
+    """
+    Load the `.env` file once per process and return a read-only snapshot of
+    the environment. Real environment variables take precedence over `.env`.
+    Cached so Streamlit reruns and re-imports don't re-read/re-parse the file.
+    """
+    load_dotenv(override=False)
+    return MappingProxyType(dict(os.environ))
+
+
+ENV = get_env()
@@ -0,0 +1,34 @@
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core.pipeline.transport import RequestsTransport
+
+
+def build_openai_http_client(
+    max_connections: int = 64,
+    max_keepalive_connections: int = 32,
+    timeout: float = 30.0,
+) -> httpx.Client:
+    """
+    Create an httpx client for AzureOpenAI with a sized keep-alive pool,
+    so repeated calls reuse warm TCP/TLS connections.
+    """
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        ),
+        timeout=timeout,
+    )
+
+
+def build_search_transport(pool_connections: int = 32, pool_maxsize: int = 64) -> RequestsTransport:
+    """
+    Create an Azure SDK transport backed by one requests.Session with a sized
+    connection pool, shared by every call made through the client(s) using it.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session, session_owner=False)
@@ -1,6 +1,9 @@
+import atexit
 import logging
+import os
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
 # --------------------------
@@ -14,17 +17,81 @@ LOG_DIR.mkdir(parents=True, exist_ok=True)
 logging.getLogger("azure").setLevel(logging.WARNING)
 logging.getLogger("azure.core.pipeline.policies.http_logging_policy").setLevel(logging.WARNING)
 
+# Warnings are routed into logging once per process, not once per logger
+_WARN_CAPTURED = False
+
+# Background listeners writing file logs (one per log file), stopped at exit
+_LISTENERS: list[tuple[QueueListener, MemoryHandler]] = []
+
+
+def _stop_listeners() -> None:
+    """Drain the log queues and flush buffered records to disk."""
+    for listener, mem in _LISTENERS:
+        listener.stop()
+        mem.flush()
+
+
+atexit.register(_stop_listeners)
+
 
 def _console_supports_utf8() -> bool:
     enc = getattr(sys.stdout, "encoding", None) or ""
-    return enc.lower().replace("-", "") == "utf8"
+    if enc.lower().replace("-", "") == "utf8":
+        return True
+    # Switch non-UTF-8 consoles (e.g. Windows CP1252) to UTF-8 once, instead of
+    # sanitizing every record; errors="replace" means writes never raise.
+    if hasattr(sys.stdout, "reconfigure"):
+        try:
+            sys.stdout.reconfigure(encoding="utf-8", errors="replace")
+            return True
+        except (ValueError, OSError):
+            pass  # stream can't be reconfigured (e.g. already written to / detached)
+    return False
+
+
+class CachedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that avoids the os.path stat calls on every emit:
+      - "is regular file" is checked once, when the stream is (re)opened
+      - records clearly below maxBytes skip the base rollover check
+    """
+    def _open(self):
+        stream = super()._open()
+        self._is_real_file = os.path.isfile(self.baseFilename)
+        return stream
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.maxBytes <= 0:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        if not self._is_real_file:
+            return False  # never rollover anything other than regular files
+
+        msg_len = len(self.format(record).encode(self.encoding or "utf-8")) + 1
+        if self.stream.tell() + msg_len < self.maxBytes:
+            return False  # clearly below threshold
+
+        return super().shouldRollover(record)
+
+
+class SafeFormatter(logging.Formatter):
+    """Avoid UnicodeEncodeError in Windows CP1252 consoles."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._enc = getattr(sys.stdout, "encoding", None) or "utf-8"
+
+    def format(self, record: logging.LogRecord) -> str:
+        return super().format(record).encode(self._enc, errors="replace").decode(self._enc)
 
 
 def setup_logger(name: str, log_file: str, level: int = logging.INFO) -> logging.Logger:
     """
     Create a logger with:
       - Rotating file handler (UTF-8) -> logs/<log_file>
-      - Console handler (safe for Windows consoles)
+        written from a background thread via QueueHandler/QueueListener,
+        buffered so INFO/DEBUG batch to disk while ERROR+ flush immediately
+      - Console handler (safe for Windows consoles), kept synchronous
     """
     logger = logging.getLogger(name)
     logger.setLevel(level)
@@ -35,7 +102,7 @@ def setup_logger(name: str, log_file: str, level: int = logging.INFO) -> logging
 
     # ---- File handler (UTF-8, rotating) ----
     file_path = LOG_DIR / log_file
-    fh = RotatingFileHandler(
+    fh = CachedRotatingFileHandler(
         filename=file_path,
         maxBytes=5 * 1024 * 1024,   # 5 MB
         backupCount=3,
@@ -47,32 +114,34 @@ def setup_logger(name: str, log_file: str, level: int = logging.INFO) -> logging
     )
     fh.setFormatter(file_fmt)
     fh.setLevel(level)
-    logger.addHandler(fh)
 
-    # ---- Console handler ----
-    ch = logging.StreamHandler(stream=sys.stdout)
+    # ---- Move file writes off the caller thread ----
+    mem = MemoryHandler(capacity=512, flushLevel=logging.ERROR, target=fh)
+    mem.setLevel(level)
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(log_queue, mem, respect_handler_level=True)
+    listener.start()
+    _LISTENERS.append((listener, mem))
 
-    class StripNonEncodableFilter(logging.Filter):
-        """Avoid UnicodeEncodeError in Windows CP1252 consoles."""
-        def filter(self, record: logging.LogRecord) -> bool:
-            msg = record.getMessage()
-            enc = getattr(sys.stdout, "encoding", None) or "utf-8"
-            try:
-                msg.encode(enc)
-            except UnicodeEncodeError:
-                record.msg = msg.encode(enc, errors="replace").decode(enc)
-                record.args = ()
-            return True
+    qh = QueueHandler(log_queue)
+    qh.setLevel(level)
+    logger.addHandler(qh)
 
-    if not _console_supports_utf8():
-        ch.addFilter(StripNonEncodableFilter())
+    # ---- Console handler ----
+    ch = logging.StreamHandler(stream=sys.stdout)
 
-    console_fmt = logging.Formatter("%(levelname)s | %(message)s")
-    ch.setFormatter(console_fmt)
+    console_fmt = "%(levelname)s | %(message)s"
+    if _console_supports_utf8():
+        ch.setFormatter(logging.Formatter(console_fmt))
+    else:
+        ch.setFormatter(SafeFormatter(console_fmt))
     ch.setLevel(level)
     logger.addHandler(ch)
 
-    logging.captureWarnings(True)  # capture warnings too
+    global _WARN_CAPTURED
+    if not _WARN_CAPTURED:
+        logging.captureWarnings(True)  # capture warnings too
+        _WARN_CAPTURED = True
 
     return logger
 
@@ -1,10 +1,10 @@
-import os
-from dotenv import load_dotenv
 from azure.search.documents.indexes import SearchIndexClient
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import ResourceNotFoundError
 from azure.search.documents.indexes.models import (
     SearchIndex, SearchField, SearchFieldDataType, SimpleField, SearchableField,
-    VectorSearch, HnswAlgorithmConfiguration, VectorSearchProfile
+    VectorSearch, HnswAlgorithmConfiguration, VectorSearchProfile,
+    ScalarQuantizationCompression, ScalarQuantizationParameters
 )
 
 # ------------------------------
@@ -19,20 +19,20 @@ install_global_exception_hook(logger)
 # ------------------------------
 # Step 1: Load environment variables
 # ------------------------------
-# dotenv reads `.env` file and sets environment variables.
+# ENV is the environment (plus `.env` file), loaded once per process.
 # Keeps secrets (keys, endpoints) out of code for security.
-load_dotenv()
+from src.config.env import ENV
 
-AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")  # Endpoint of Azure Cognitive Search
-AZURE_SEARCH_API_KEY = os.getenv("AZURE_SEARCH_API_KEY")    # API key for Azure Cognitive Search
-AZURE_SEARCH_INDEX = os.getenv("AZURE_SEARCH_INDEX", "client-manual-index")  # Index name
+AZURE_SEARCH_ENDPOINT = ENV.get("AZURE_SEARCH_ENDPOINT")  # Endpoint of Azure Cognitive Search
+AZURE_SEARCH_API_KEY = ENV.get("AZURE_SEARCH_API_KEY")    # API key for Azure Cognitive Search
+AZURE_SEARCH_INDEX = ENV.get("AZURE_SEARCH_INDEX", "client-manual-index")  # Index name
 
 if not AZURE_SEARCH_ENDPOINT or not AZURE_SEARCH_API_KEY:
     logger.error(" Missing Azure Search configuration in .env")
     raise ValueError("Azure Search endpoint and key must be set in environment variables")
 
 logger.info(" Starting index creation process")
-logger.debug(f"Using endpoint: {AZURE_SEARCH_ENDPOINT}, index name: {AZURE_SEARCH_INDEX}")
+logger.debug("Using endpoint: %s, index name: %s", AZURE_SEARCH_ENDPOINT, AZURE_SEARCH_INDEX)
 
 # ------------------------------
 # Step 2: Initialize Search Index Client
@@ -65,9 +65,21 @@ fields = [
 ]
 
 # Vector search config (using HNSW algorithm for fast similarity search)
+# Scalar quantization stores the vectors as int8 inside the HNSW graph (~4x less
+# memory than float32); results are reranked with the original full-precision vectors.
 vector_search = VectorSearch(
     algorithms=[HnswAlgorithmConfiguration(name="my-hnsw")],
-    profiles=[VectorSearchProfile(name="my-vector-config", algorithm_configuration_name="my-hnsw")]
+    compressions=[
+        ScalarQuantizationCompression(
+            compression_name="my-scalar-quantization",
+            parameters=ScalarQuantizationParameters(quantized_data_type="int8"),
+        )
+    ],
+    profiles=[VectorSearchProfile(
+        name="my-vector-config",
+        algorithm_configuration_name="my-hnsw",
+        compression_name="my-scalar-quantization",
+    )]
 )
 
 # Build the index definition
@@ -82,17 +94,21 @@ index = SearchIndex(
 # ------------------------------
 # - If index already exists, delete it and recreate (fresh start).
 # - Else, create a new index.
+# Existence is checked with a single get_index call (raises ResourceNotFoundError)
+# instead of listing every index name first and checking membership.
 try:
-    existing_indexes = list(index_client.list_index_names())
-    if AZURE_SEARCH_INDEX in existing_indexes:
-        logger.info(f" Index '{AZURE_SEARCH_INDEX}' already exists. Deleting old version…")
+    try:
+        index_client.get_index(AZURE_SEARCH_INDEX)
+        logger.info(" Index '%s' already exists. Deleting old version…", AZURE_SEARCH_INDEX)
         index_client.delete_index(AZURE_SEARCH_INDEX)
+    except ResourceNotFoundError:
+        logger.info(" Index '%s' does not exist yet", AZURE_SEARCH_INDEX)
 
-    logger.info(f"Creating index '{AZURE_SEARCH_INDEX}'...")
+    logger.info("Creating index '%s'...", AZURE_SEARCH_INDEX)
     index_client.create_index(index)
-    logger.info(f"Index '{AZURE_SEARCH_INDEX}' created successfully!")
+    logger.info("Index '%s' created successfully!", AZURE_SEARCH_INDEX)
 
 except Exception as e:
     # Any error here (network, permissions, invalid schema) is logged with full traceback
-    logger.exception(f" Failed to create/update index: {e}")
+    logger.exception(" Failed to create/update index: %s", e)
     raise
@@ -1,128 +1,345 @@
 import os
-from dotenv import load_dotenv
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, StorageContext
+import logging
+import json
+import hashlib
+import sqlite3
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import partial
+from contextlib import closing
+import numpy as np
+import orjson
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.schema import MetadataMode
 from llama_index.readers.file import PDFReader
-from llama_index.vector_stores.azureaisearch import AzureAISearchVectorStore
 from llama_index.embeddings.azure_openai import AzureOpenAIEmbedding
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError
+from azure.core.rest import HttpRequest
 from azure.search.documents import SearchClient
 from llama_index.core.node_parser import SentenceSplitter
+from src.config.http_config import build_openai_http_client, build_search_transport
 
 # ------------------------------
 # Import & configure logging
 # ------------------------------
 # setup_logger → writes logs to logs/ingest.log in the root folder
 # install_global_exception_hook → ensures uncaught exceptions are logged
+# Both run in main(): spawned parse workers re-import this module and must not
+# start their own log listener or hold logs/ingest.log open (breaks rollover on Windows).
 from src.config.logger_config import setup_logger, install_global_exception_hook
-logger = setup_logger(__name__, log_file="ingest.log")
-install_global_exception_hook(logger)
+logger = logging.getLogger(__name__)
 
 # ------------------------------
 # Load environment variables
 # ------------------------------
-# dotenv looks for a `.env` file in the current directory and loads variables from it
+# ENV holds the environment plus variables from the `.env` file, loaded once per process
 # This allows you to keep API keys and endpoints outside the code (better security)
-load_dotenv()
+from src.config.env import ENV
 
 # ------------------------------
 # Azure configuration values
 # ------------------------------
 # These values are fetched from the .env file
 # They include endpoints, API keys, and container/index names needed for services
-search_endpoint = os.getenv("AZURE_SEARCH_ENDPOINT")           # Endpoint of the Azure AI Search service
-search_key = os.getenv("AZURE_SEARCH_API_KEY")                 # API key for Azure AI Search
-search_index = os.getenv("AZURE_SEARCH_INDEX")                 # Name of the search index
+search_endpoint = ENV.get("AZURE_SEARCH_ENDPOINT")           # Endpoint of the Azure AI Search service
+search_key = ENV.get("AZURE_SEARCH_API_KEY")                 # API key for Azure AI Search
+search_index = ENV.get("AZURE_SEARCH_INDEX")                 # Name of the search index
 
-aoai_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")             # Endpoint of Azure OpenAI resource
-aoai_key = os.getenv("AZURE_OPENAI_API_KEY")                   # API key for Azure OpenAI
-aoai_embed_model = os.getenv("AZURE_OPENAI_EMBED_DEPLOYMENT")  # Deployment name of embedding model
-aoai_api_version = os.getenv("OPENAI_API_VERSION")             # API version for Azure OpenAI
+aoai_endpoint = ENV.get("AZURE_OPENAI_ENDPOINT")             # Endpoint of Azure OpenAI resource
+aoai_key = ENV.get("AZURE_OPENAI_API_KEY")                   # API key for Azure OpenAI
+aoai_embed_model = ENV.get("AZURE_OPENAI_EMBED_DEPLOYMENT")  # Deployment name of embedding model
+aoai_api_version = ENV.get("OPENAI_API_VERSION")             # API version for Azure OpenAI
 
-if not search_endpoint or not search_key or not search_index:
-    logger.error("Missing Azure Search configuration in .env")
-    raise ValueError("Azure Search settings must be set in environment variables")
+# Azure AI Search accepts up to 1000 documents / 16 MB per indexing request
+batch_size = int(ENV.get("AZURE_SEARCH_BATCH_SIZE", "1000"))  # Max documents per upload request
+max_batch_bytes = 15 * 1024 * 1024                                # Stay safely below the 16 MB limit
+# Raw uploads don't go through the SDK's URL/api-version handling, so both are set here.
+search_api_version = ENV.get("AZURE_SEARCH_API_VERSION", "2024-07-01")  # REST API version for raw uploads
+ingest_workers = int(ENV.get("INGEST_WORKERS", "8"))            # Parallel upload threads
+parse_workers = max(1, (os.cpu_count() or 1) - 1)                 # Parallel PDF parsing processes
 
-if not aoai_endpoint or not aoai_key or not aoai_embed_model:
-    logger.error("Missing Azure OpenAI configuration in .env")
-    raise ValueError("Azure OpenAI settings must be set in environment variables")
+embed_model_name = "text-embedding-3-large"                      # Embedding model family
+embed_dimensions = 3072                                           # Vector size (must match the index schema)
+embed_cache_path = ENV.get("EMBED_CACHE_PATH", "./.embed_cache.sqlite")  # Local cache of chunk embeddings
+embed_batch_size = 100                                            # Chunks sent per embeddings request
+embed_cache_slice = embed_batch_size * 10                         # Chunks embedded per cache commit
 
-logger.info("Starting ingestion process")
-logger.debug(f"Using index: {search_index}, endpoint: {search_endpoint}")
 
 # ------------------------------
-# Step 1: Download PDFs from Azure Blob Storage
+# Parse helper (runs in worker processes)
 # ------------------------------
-# Create a local folder to temporarily store downloaded PDFs
-local_dir = "./data"
+def load_file(input_file, file_extractor):
+    """Parse one file into documents (same metadata handling as SimpleDirectoryReader.load_data)."""
+    return SimpleDirectoryReader(input_files=[input_file], file_extractor=file_extractor).load_data()
 
-# ------------------------------
-# Step 2: Load documents from the local folder
-# ------------------------------
-logger.info(" Reading PDFs from local data folder...")
-try:
-    documents = SimpleDirectoryReader(
-        local_dir,
-        file_extractor={".pdf": PDFReader()}   # Only .pdf files are handled with PDFReader
-    ).load_data()
-    logger.info(f"Loaded {len(documents)} documents")
-except Exception as e:
-    logger.exception("Failed while reading documents")
-    raise
 
 # ------------------------------
-# Step 3: Setup embedding model (Azure OpenAI)
+# Upload helpers
 # ------------------------------
-# Embeddings turn text into vectors (lists of numbers) that capture meaning/semantics.
-# AzureOpenAIEmbedding is a wrapper around the Azure OpenAI embeddings API.
-logger.info("Initializing Azure OpenAI embedding model...")
-embed_model = AzureOpenAIEmbedding(
-    model="text-embedding-3-large",                        # Embedding model family (3072 dimensions)
-    deployment_name=aoai_embed_model,                      # Your deployment name in Azure portal
-    api_key=aoai_key,                                      # Azure OpenAI API key
-    azure_endpoint=aoai_endpoint,                          # Endpoint for the resource
-    api_version=aoai_api_version,                          # API version string
-)
+def batch_actions(actions, batch_size, max_bytes):
+    """
+    Serialize each upload action once (orjson, NumPy vectors encoded in C) and
+    pack them into batches of at most `batch_size` documents or `max_bytes`
+    of JSON payload, whichever is hit first.
+    Each batch is a list of (doc_id, encoded action) pairs.
+    """
+    batch, batch_bytes = [], 0
+    for action in actions:
+        encoded = orjson.dumps(action, option=orjson.OPT_SERIALIZE_NUMPY)
+        if batch and (len(batch) >= batch_size or batch_bytes + len(encoded) > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append((action["doc_id"], encoded))
+        batch_bytes += len(encoded)
+    if batch:
+        yield batch
+
+
+class PartialUploadError(Exception):
+    """Raised when some documents in a batch were not indexed, to trigger a retry."""
+
+
+class RejectedDocumentsError(Exception):
+    """Raised when Azure AI Search permanently rejected some documents (e.g. invalid document)."""
 
-# ------------------------------
-# Step 4: Setup Azure AI Search Vector Store
-# ------------------------------
-logger.info("Connecting to Azure AI Search vector store...")
-search_client = SearchClient(
-    endpoint=search_endpoint,               # Service endpoint
-    index_name=search_index,                # Index name inside Azure AI Search
-    credential=AzureKeyCredential(search_key)  # Auth with API key
-)
 
-vector_store = AzureAISearchVectorStore(
-    search_or_index_client=search_client,  # The connected client
-    id_field_key="doc_id",                     # Maps unique ID of each chunk
-    chunk_field_key="content",             # Field to store actual text chunk
-    embedding_field_key="embedding",       # Field to store the generated embedding vector
-    metadata_string_field_key="metadata",  # Field for extra info (e.g., source filename, page number)
-    doc_id_field_key="doc_id",             # Field for original doc ID (groups chunks together)
+# Only throttling / transient service errors are worth retrying; 4xx like
+# 400/401/403/404 (bad payload, bad key, missing index) fail immediately.
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Per-document statusCode values that are worth re-sending (conflict, concurrency,
+# service busy/throttled); anything else (e.g. 400 invalid document) is permanent.
+RETRYABLE_DOCUMENT_STATUS_CODES = {409, 422, 429, 503}
+
+
+def is_transient_upload_error(exc):
+    """True for errors that a later attempt can plausibly fix."""
+    if isinstance(exc, PartialUploadError):
+        return True
+    return isinstance(exc, HttpResponseError) and exc.status_code in TRANSIENT_STATUS_CODES
+
+
+@retry(
+    retry=retry_if_exception(is_transient_upload_error),
+    wait=wait_exponential_jitter(initial=1, max=60),  # Exponential backoff (handles 429/503 throttling)
+    stop=stop_after_attempt(6),
+    reraise=True,
 )
+def upload_with_retry(search_client, batch, rejected):
+    """
+    Upload one batch of pre-encoded actions to Azure AI Search.
+    The JSON body is sent as-is through the client's pipeline (auth, transport),
+    so the SDK does not re-serialize the vectors.
+    On partial failure, the batch is trimmed in place to the documents with a
+    retryable status so that only those are re-sent on the next attempt;
+    permanently rejected documents are logged and appended to `rejected`.
+    """
+    body = b'{"value":[' + b",".join(encoded for _, encoded in batch) + b"]}"
+    request = HttpRequest(
+        "POST",
+        # Absolute URL: the SDK's base URL for relative paths differs between versions
+        f"{search_endpoint.rstrip('/')}/indexes('{search_index}')/docs/search.index",
+        params={"api-version": search_api_version},
+        headers={"Content-Type": "application/json"},
+        content=body,
+    )
+    response = search_client.send_request(request)
+    response.raise_for_status()  # HttpResponseError on 4xx/5xx (e.g. 429/503 throttling)
 
-storage_context = StorageContext.from_defaults(vector_store=vector_store)
+    failed = [r for r in response.json()["value"] if not r["status"]]
+    for r in failed:
+        if r.get("statusCode") not in RETRYABLE_DOCUMENT_STATUS_CODES:
+            logger.error("Chunk %s rejected (%s): %s", r["key"], r.get("statusCode"), r.get("errorMessage"))
+            rejected.append(r["key"])
+
+    retry_keys = {r["key"] for r in failed if r.get("statusCode") in RETRYABLE_DOCUMENT_STATUS_CODES}
+    sent = len(batch)
+    batch[:] = [item for item in batch if item[0] in retry_keys]
+    if retry_keys:
+        logger.warning("%s chunks failed to index, retrying them", len(retry_keys))
+        raise PartialUploadError(f"{len(retry_keys)} documents failed to index")
+    logger.info("Uploaded batch of %s chunks", sent - len(failed))
 
-# ------------------------------
-# Step 5: Split documents into smaller chunks
-# ------------------------------
-logger.info("Splitting documents into smaller chunks...")
-splitter = SentenceSplitter(chunk_size=1000, chunk_overlap=100)
-nodes = splitter.get_nodes_from_documents(documents)
-logger.info(f"Split {len(documents)} documents into {len(nodes)} chunks")
 
 # ------------------------------
-# Step 6: Build & push index into Azure AI Search
+# Ingestion pipeline
 # ------------------------------
-logger.info("Building index and pushing to Azure AI Search...")
-try:
-    index = VectorStoreIndex(
-        nodes,                           # List of text chunks
-        storage_context=storage_context, # Where to save them (Azure AI Search index)
-        embed_model=embed_model          # Embedding model to generate semantic vectors
+def main():
+    """Run the ingestion pipeline: read PDFs -> chunk -> embed -> upload to Azure AI Search."""
+    setup_logger(__name__, log_file="ingest.log")
+    install_global_exception_hook(logger)
+
+    if not search_endpoint or not search_key or not search_index:
+        logger.error("Missing Azure Search configuration in .env")
+        raise ValueError("Azure Search settings must be set in environment variables")
+
+    if not aoai_endpoint or not aoai_key or not aoai_embed_model:
+        logger.error("Missing Azure OpenAI configuration in .env")
+        raise ValueError("Azure OpenAI settings must be set in environment variables")
+
+    logger.info("Starting ingestion process")
+    logger.debug("Using index: %s, endpoint: %s", search_index, search_endpoint)
+
+    # ------------------------------
+    # Step 1: Download PDFs from Azure Blob Storage
+    # ------------------------------
+    # Create a local folder to temporarily store downloaded PDFs
+    local_dir = "./data"
+
+    # ------------------------------
+    # Step 2: Load documents from the local folder and split them into smaller chunks
+    # ------------------------------
+    # PDFs are parsed in parallel worker processes (spawned; safe because the
+    # pipeline only runs under the __main__ guard below). Each file is split into
+    # chunks as soon as its worker finishes, while the other files are still parsing.
+    logger.info(" Reading PDFs from local data folder (%s workers)...", parse_workers)
+    splitter = SentenceSplitter(chunk_size=1000, chunk_overlap=100)
+    file_extractor = {".pdf": PDFReader()}   # Only .pdf files are handled with PDFReader
+    nodes = []
+    doc_count = 0
+    try:
+        input_files = SimpleDirectoryReader(local_dir, file_extractor=file_extractor).input_files
+        with ProcessPoolExecutor(
+            max_workers=min(parse_workers, len(input_files)), mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            futures = [pool.submit(load_file, f, file_extractor) for f in input_files]
+            for future in as_completed(futures):
+                file_docs = future.result()
+                nodes.extend(splitter.get_nodes_from_documents(file_docs))
+                doc_count += len(file_docs)
+        logger.info("Loaded %s documents", doc_count)
+        logger.info("Split %s documents into %s chunks", doc_count, len(nodes))
+    except Exception as e:
+        logger.exception("Failed while reading documents")
+        raise
+
+    # ------------------------------
+    # Step 3: Setup embedding model (Azure OpenAI)
+    # ------------------------------
+    # Embeddings turn text into vectors (lists of numbers) that capture meaning/semantics.
+    # AzureOpenAIEmbedding is a wrapper around the Azure OpenAI embeddings API.
+    logger.info("Initializing Azure OpenAI embedding model...")
+    embed_model = AzureOpenAIEmbedding(
+        model=embed_model_name,                                # Embedding model family (3072 dimensions)
+        deployment_name=aoai_embed_model,                      # Your deployment name in Azure portal
+        api_key=aoai_key,                                      # Azure OpenAI API key
+        azure_endpoint=aoai_endpoint,                          # Endpoint for the resource
+        api_version=aoai_api_version,                          # API version string
+        embed_batch_size=embed_batch_size,                     # Chunks sent per embeddings request
+        http_client=build_openai_http_client(),                # Pooled keep-alive connections
+    )
+
+    # ------------------------------
+    # Step 4: Setup Azure AI Search client
+    # ------------------------------
+    logger.info("Connecting to Azure AI Search...")
+    search_client = SearchClient(
+        endpoint=search_endpoint,               # Service endpoint
+        index_name=search_index,                # Index name inside Azure AI Search
+        credential=AzureKeyCredential(search_key),  # Auth with API key
+        transport=build_search_transport(                   # One pooled session shared by all upload workers
+            pool_connections=ingest_workers, pool_maxsize=ingest_workers
+        ),
+        retry_total=0,                          # Uploads retry via upload_with_retry; don't stack SDK retries
     )
-    logger.info(f"Successfully pushed {len(nodes)} chunks into Azure AI Search index '{search_index}'")
-except Exception as e:
-    logger.exception("Failed while building/pushing index")
-    raise
+
+    # ------------------------------
+    # Step 5: Embed all chunks in bulk (reusing cached embeddings)
+    # ------------------------------
+    # Embeddings are cached locally, keyed by SHA-256 of (model, deployment, dimensions,
+    # chunk text), so re-runs only pay for chunks that are new or changed, and
+    # re-pointing the deployment at another model never reuses stale vectors.
+    # One embeddings request covers many chunks (Azure OpenAI accepts an array `input`)
+    logger.info("Generating embeddings for all chunks...")
+    texts = [n.get_content(metadata_mode=MetadataMode.EMBED) for n in nodes]
+    key_prefix = f"{embed_model_name}|{aoai_embed_model}|{embed_dimensions}|"
+    keys = [hashlib.sha256(f"{key_prefix}{t}".encode("utf-8")).hexdigest() for t in texts]
+
+    # One entry per distinct chunk (identical chunks share a key)
+    node_by_key = dict(zip(keys, nodes))
+    text_by_key = dict(zip(keys, texts))
+    unique_keys = list(node_by_key)
+
+    try:
+        with closing(sqlite3.connect(embed_cache_path)) as cache:
+            with cache:
+                cache.execute("CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vec BLOB)")
+
+            # ---- Look up cached vectors (in slices to stay under SQLite's parameter limit) ----
+            cached = {}
+            for i in range(0, len(unique_keys), 500):
+                key_slice = unique_keys[i:i + 500]
+                rows = cache.execute(
+                    f"SELECT hash, vec FROM embeddings WHERE hash IN ({','.join('?' * len(key_slice))})",
+                    key_slice,
+                )
+                cached.update({h: np.frombuffer(vec, dtype=np.float32) for h, vec in rows})
+
+            # ---- Embed only the cache misses ----
+            # Misses are embedded slice by slice and each slice is committed before the
+            # next request, so a failure late in the run keeps everything embedded so far.
+            miss_keys = [k for k in unique_keys if k not in cached]
+            logger.info("Embedding cache: %s hits, %s misses", len(unique_keys) - len(miss_keys), len(miss_keys))
+            for i in range(0, len(miss_keys), embed_cache_slice):
+                slice_keys = miss_keys[i:i + embed_cache_slice]
+                slice_embeddings = embed_model.get_text_embedding_batch([text_by_key[k] for k in slice_keys])
+                # Vectorized post-processing: one contiguous float32 matrix, L2-normalized per row
+                slice_matrix = np.asarray(slice_embeddings, dtype=np.float32)
+                if slice_matrix.ndim != 2 or slice_matrix.shape[1] != embed_dimensions:
+                    raise ValueError(
+                        f"Deployment '{aoai_embed_model}' returned vectors of shape {slice_matrix.shape}, "
+                        f"expected {embed_dimensions} dimensions"
+                    )
+                slice_matrix /= np.linalg.norm(slice_matrix, axis=1, keepdims=True)
+                with cache:  # commit this slice
+                    cache.executemany(
+                        "INSERT OR REPLACE INTO embeddings (hash, vec) VALUES (?, ?)",
+                        [(k, row.tobytes()) for k, row in zip(slice_keys, slice_matrix)],
+                    )
+                cached.update(zip(slice_keys, slice_matrix))
+                logger.info("Embedded and cached %s/%s new chunks", i + len(slice_keys), len(miss_keys))
+
+        embeddings = np.vstack([cached[k] for k in unique_keys]) if unique_keys else np.empty((0, 0), np.float32)
+    except Exception as e:
+        logger.exception("Failed while generating embeddings")
+        raise
+
+    # ------------------------------
+    # Step 6: Build upload actions (one search document per chunk)
+    # ------------------------------
+    # Fields match the schema defined in src/indexing/create_index.py
+    # The content hash is used as doc_id, so re-ingesting unchanged chunks
+    # overwrites the same documents instead of adding duplicates.
+    actions = [
+        {
+            "@search.action": "mergeOrUpload",   # Insert new docs, update existing ones
+            "doc_id": k,                         # Stable chunk ID (index key)
+            "content": n.get_content(),          # Actual text chunk
+            "embedding": emb,                    # Embedding vector (float32 NumPy row, serialized by orjson)
+            "metadata": json.dumps(n.metadata),  # Extra info (e.g., source filename, page number)
+        }
+        for (k, n), emb in zip(node_by_key.items(), embeddings)
+    ]
+
+    # ------------------------------
+    # Step 7: Push chunks into Azure AI Search in parallel batches
+    # ------------------------------
+    logger.info("Pushing chunks to Azure AI Search in batches (%s workers)...", ingest_workers)
+    try:
+        batches = list(batch_actions(actions, batch_size, max_batch_bytes))
+        rejected = []  # keys of documents the service rejected permanently
+        with ThreadPoolExecutor(max_workers=ingest_workers) as ex:
+            list(ex.map(partial(upload_with_retry, search_client, rejected=rejected), batches))
+        if rejected:
+            raise RejectedDocumentsError(f"{len(rejected)} chunks were rejected by Azure AI Search")
+        logger.info("Successfully pushed %s chunks into Azure AI Search index '%s'", len(actions), search_index)
+    except Exception as e:
+        logger.exception("Failed while pushing chunks to Azure AI Search")
+        raise
+
+
+# Guard required: the PDF parse pool spawns processes that re-import this module.
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,4 @@
-import os
-from dotenv import load_dotenv
 import streamlit as st
-from azure.search.documents import SearchClient
-from azure.core.credentials import AzureKeyCredential
-from openai import AzureOpenAI
-import copy
 
 # ==========================================================
 # 0. Import & configure logging
@@ -21,19 +15,19 @@ install_global_exception_hook(logger)
 # ==========================================================
 # These are secret keys and service endpoints stored outside the code 
 # to avoid hardcoding credentials.
-# load_dotenv() reads the .env file and sets the values in environment variables.
-load_dotenv()
+# ENV is read once per process (cached), so Streamlit reruns don't re-parse .env.
+from src.config.env import ENV
 
 # Fetch Azure OpenAI service settings from environment
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")               # full endpoint URL, e.g., https://xxx.openai.azure.com
-AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_API_KEY")                     # primary/secondary key for Azure OpenAI
-AZURE_OPENAI_CHAT_DEPLOYMENT = os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT", "chat")  # deployment name for chat model
-AZURE_OPENAI_EMBED_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBED_DEPLOYMENT", "embed") # deployment name for embedding model
+AZURE_OPENAI_ENDPOINT = ENV.get("AZURE_OPENAI_ENDPOINT")               # full endpoint URL, e.g., https://xxx.openai.azure.com
+AZURE_OPENAI_KEY = ENV.get("AZURE_OPENAI_API_KEY")                     # primary/secondary key for Azure OpenAI
+AZURE_OPENAI_CHAT_DEPLOYMENT = ENV.get("AZURE_OPENAI_CHAT_DEPLOYMENT", "chat")  # deployment name for chat model
+AZURE_OPENAI_EMBED_DEPLOYMENT = ENV.get("AZURE_OPENAI_EMBED_DEPLOYMENT", "embed") # deployment name for embedding model
 
 # Fetch Azure Cognitive Search service settings from environment
-AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT")               # endpoint for Cognitive Search
-AZURE_SEARCH_API_KEY = os.getenv("AZURE_SEARCH_API_KEY")                 # API key for Cognitive Search
-AZURE_SEARCH_INDEX = os.getenv("AZURE_SEARCH_INDEX")                     # index name inside Cognitive Search
+AZURE_SEARCH_ENDPOINT = ENV.get("AZURE_SEARCH_ENDPOINT")               # endpoint for Cognitive Search
+AZURE_SEARCH_API_KEY = ENV.get("AZURE_SEARCH_API_KEY")                 # API key for Cognitive Search
+AZURE_SEARCH_INDEX = ENV.get("AZURE_SEARCH_INDEX")                     # index name inside Cognitive Search
 
 if not AZURE_OPENAI_ENDPOINT or not AZURE_OPENAI_KEY:
     logger.error(" Missing Azure OpenAI configuration in .env")
@@ -47,30 +41,50 @@ logger.info("Starting chatbot app (Streamlit + Azure OpenAI + Cognitive Search)"
 
 
 # ==========================================================
-# 2. Initialize Azure OpenAI client
+# 2. Azure OpenAI client (created lazily, once per process)
 # ==========================================================
 # AzureOpenAI client wraps API calls to Azure-hosted OpenAI models.
 # It needs endpoint, key, and correct API version.
 # NOTE: api_version must match your Azure OpenAI resource version.
-aoai_client = AzureOpenAI(
-    api_key=AZURE_OPENAI_KEY,
-    api_version="2024-12-01-preview",   # ensure this matches supported API version
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-)
-logger.info("Azure OpenAI client initialized successfully")
+# The SDK import and client construction are deferred to the first question so the
+# UI renders first; st.cache_resource keeps the client (and its warm connection pool)
+# across Streamlit reruns.
+@st.cache_resource(show_spinner=False)
+def _aoai():
+    from openai import AzureOpenAI
+    from src.config.http_config import build_openai_http_client
+
+    # http_client keeps a pool of warm connections that every call reuses.
+    client = AzureOpenAI(
+        api_key=AZURE_OPENAI_KEY,
+        api_version="2024-12-01-preview",   # ensure this matches supported API version
+        azure_endpoint=AZURE_OPENAI_ENDPOINT,
+        http_client=build_openai_http_client(),
+    )
+    logger.info("Azure OpenAI client initialized successfully")
+    return client
 
 
 # ==========================================================
-# 3. Initialize Azure Cognitive Search client
+# 3. Azure Cognitive Search client (created lazily, once per process)
 # ==========================================================
 # SearchClient allows us to query documents in Azure Cognitive Search.
 # Requires endpoint, index name, and an API key credential.
-search_client = SearchClient(
-    endpoint=AZURE_SEARCH_ENDPOINT,
-    index_name=AZURE_SEARCH_INDEX,
-    credential=AzureKeyCredential(AZURE_SEARCH_API_KEY)
-)
-logger.info(f" Connected to Azure Cognitive Search index: {AZURE_SEARCH_INDEX}")
+@st.cache_resource(show_spinner=False)
+def _search():
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents import SearchClient
+    from src.config.http_config import build_search_transport
+
+    # transport wraps a pooled requests.Session so connections stay alive between searches.
+    client = SearchClient(
+        endpoint=AZURE_SEARCH_ENDPOINT,
+        index_name=AZURE_SEARCH_INDEX,
+        credential=AzureKeyCredential(AZURE_SEARCH_API_KEY),
+        transport=build_search_transport(),
+    )
+    logger.info(" Connected to Azure Cognitive Search index: %s", AZURE_SEARCH_INDEX)
+    return client
 
 
 # ==========================================================
@@ -83,17 +97,17 @@ def get_top_chunks(query, top_k=10):
     2. Send that vector to Azure Cognitive Search.
     3. Retrieve top-k most similar text chunks (documents).
     """
-    logger.info(f" Retrieving top {top_k} chunks for query: {query}")
+    logger.info(" Retrieving top %s chunks for query: %s", top_k, query)
 
     try:
         # ---- Step 1: Generate embedding for the user query ----
-        query_embedding = aoai_client.embeddings.create(
+        query_embedding = _aoai().embeddings.create(
             input=query,                           # text to embed
             model=AZURE_OPENAI_EMBED_DEPLOYMENT    # embedding deployment name in Azure
         ).data[0].embedding                         # extract embedding vector (list of floats)
 
         # ---- Step 2: Search Cognitive Search using vector similarity ----
-        results = search_client.search(
+        results = _search().search(
             search_text="",   # left empty → only vector similarity is considered
             vector_queries=[{
                 "kind": "vector",              # REQUIRED → tells service it's a vector search
@@ -101,19 +115,20 @@ def get_top_chunks(query, top_k=10):
                 "fields": "embedding",         # index field where embeddings are stored
                 "k": top_k                     # number of top results to return
             }],
-            select=["content", "metadata", "doc_id"]  # only fetch these fields from documents
+            select=["content", "metadata"],  # only fetch the fields used in the prompt
+            top=top_k,                       # cap the number of documents returned
+            include_total_count=False        # skip counting all matches
         )
 
         # ---- Step 3: Collect retrieved chunks with source metadata ----
-        chunks = []
-        for r in results:
-            content = r.get("content")       # actual chunk text
-            metadata = r.get("metadata", "") # optional metadata (e.g., filename, page #)
-            doc_id = r.get("doc_id", "")     # unique doc ID
-            if content:
-                chunks.append(f"{content}\n(Source: {metadata or doc_id})")
-
-        logger.info(f" Retrieved {len(chunks)} chunks for query: {query}")
+        # metadata holds the source info (e.g., filename, page #)
+        chunks = [
+            f"{r['content']}\n(Source: {r.get('metadata') or ''})"
+            for r in results
+            if r.get("content")
+        ]
+
+        logger.info(" Retrieved %s chunks for query: %s", len(chunks), query)
         return chunks
 
     except Exception as e:
@@ -124,41 +139,44 @@ def get_top_chunks(query, top_k=10):
 # ==========================================================
 # 5. Generate an AI-powered answer using retrieved chunks
 # ==========================================================
+# System instruction is built once at import time and reused for every turn.
+SYSTEM_MSG = {
+    "role": "system",
+    "content": (
+        "You are a helpful assistant. Use the provided context to answer questions accurately. "
+        "If the context is insufficient, give the most careful, concise answer possible. "
+        "Always cite the sources when available. Do not hallucinate beyond the context."
+    )
+}
+
+
 def generate_answer(user_query, chat_history):
     """
     Generate chatbot response:
     - Search Cognitive Search for relevant context
-    - Construct prompt with chat history + retrieved context
+    - Construct prompt with system instruction + chat history + retrieved context
     - Call Azure OpenAI chat model to generate an answer
     """
-    logger.info(f"Generating answer for user query: {user_query}")
+    logger.info("Generating answer for user query: %s", user_query)
 
     # ---- Step 1: Retrieve supporting context from Cognitive Search ----
     context_chunks = get_top_chunks(user_query, top_k=10)
-    context_text = "\n".join(context_chunks) if context_chunks else ""
-
-    # ---- Step 2: Copy chat history ----
-    messages = copy.deepcopy(chat_history)
-
-    # ---- Step 3: Add system instruction ----
-    messages.append({
-        "role": "system",
-        "content": (
-            "You are a helpful assistant. Use the provided context to answer questions accurately. "
-            "If the context is insufficient, give the most careful, concise answer possible. "
-            "Always cite the sources when available. Do not hallucinate beyond the context."
-        )
-    })
 
-    # ---- Step 4: Add user query (with context attached) ----
-    messages.append({
-        "role": "user",
-        "content": f"Context:\n{context_text}\n\nQuestion: {user_query}"
-    })
+    # ---- Step 2: System instruction followed by a shallow copy of chat history ----
+    # Shallow copy is enough: messages are only appended, never mutated.
+    messages = [SYSTEM_MSG, *chat_history]
+
+    # ---- Step 3: Add user query (with context attached) ----
+    # Built with a single join so the context is only copied once.
+    buf = ["Context:\n"]
+    buf.extend(chunk + "\n" for chunk in context_chunks)
+    buf.append("\nQuestion: ")
+    buf.append(user_query)
+    messages.append({"role": "user", "content": "".join(buf)})
 
-    # ---- Step 5: Generate AI response from Azure OpenAI ----
+    # ---- Step 4: Generate AI response from Azure OpenAI ----
     try:
-        response = aoai_client.chat.completions.create(
+        response = _aoai().chat.completions.create(
             model=AZURE_OPENAI_CHAT_DEPLOYMENT,   # which deployment to use
             messages=messages,                    # chat history + context
             temperature=0.2,                      # low temp → less randomness, more factual
@@ -171,7 +189,7 @@ def generate_answer(user_query, chat_history):
         logger.exception("Failed to generate AI response")
         answer = f"Error generating response: {e}"
 
-    # ---- Step 6: Update chat history with new turn ----
+    # ---- Step 5: Update chat history with new turn ----
     chat_history.append({"role": "user", "content": user_query})
     chat_history.append({"role": "assistant", "content": answer})
 
@@ -197,7 +215,7 @@ for msg in st.session_state.chat_history:
 
 # ---- Input box at bottom of page ----
 if prompt := st.chat_input("Ask about the Client Manual…"):
-    logger.info(f" User asked: {prompt}")
+    logger.info(" User asked: %s", prompt)
     _, st.session_state.chat_history = generate_answer(prompt, st.session_state.chat_history)
     st.rerun()
 